@@ -4,13 +4,31 @@
 
 import argparse
 import ast
-import difflib
+import functools
+import os
 from pathlib import Path
+import re
 import sys
-from typing import Dict, Iterable, Literal, Mapping, Optional, Set
+from typing import (
+    AbstractSet,
+    Dict,
+    Iterable,
+    Iterator,
+    Literal,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
 
 import regex
 
+try:
+    from cydifflib import unified_diff  # type: ignore[import-not-found, import-untyped]
+except ImportError:
+    from difflib import unified_diff
+
 if sys.version_info >= (3, 10):
     from itertools import pairwise  # novermin
 else:
@@ -41,7 +59,7 @@ def print_error(s: str, *, color: bool) -> None:
 def print_diff(
     old_contents: str, new_contents: str, old_path: str, new_path: str, *, color: bool
 ) -> None:
-    diff_lines = difflib.unified_diff(
+    diff_lines = unified_diff(
         old_contents.splitlines(keepends=True),
         new_contents.splitlines(keepends=True),
         old_path,
@@ -115,10 +133,17 @@ find_installation
 """
 
 
+# PY_INSTALLATION_PATTERN and SUBDIR_PATTERN don't need any regex extensions,
+# so use the standard library re module for them.
+PY_INSTALLATION_REGEX = re.compile(
+    PY_INSTALLATION_PATTERN, flags=re.MULTILINE | re.VERBOSE
+)
+
+
 def find_py_installation(contents: str) -> Optional[str]:
-    match = regex.search(
-        PY_INSTALLATION_PATTERN, contents, flags=regex.MULTILINE | regex.VERBOSE
-    )
+    if "find_installation" not in contents:
+        return None
+    match = PY_INSTALLATION_REGEX.search(contents)
     return match.group(1) if match else None
     if not match:
         raise LookupError("import('python').find_installation() not found")
@@ -139,13 +164,13 @@ subdir
 """
 
 
+SUBDIR_REGEX = re.compile(SUBDIR_PATTERN, flags=re.MULTILINE | re.VERBOSE)
+
+
 def find_subdirs(contents: str) -> Iterable[str]:
-    return [
-        ast.literal_eval(s)
-        for s in regex.findall(
-            SUBDIR_PATTERN, contents, flags=regex.MULTILINE | regex.VERBOSE
-        )
-    ]
+    if "subdir" not in contents:
+        return []
+    return [ast.literal_eval(s) for s in SUBDIR_REGEX.findall(contents)]
 
 
 def is_python_source(name: str) -> bool:
@@ -155,13 +180,18 @@ def is_python_source(name: str) -> bool:
 def find_package_sources(source_path: Path, install_path: Path) -> Dict[str, Set[str]]:
     sources = {}
     if (source_path / "__init__.py").exists():
-        for root, dirs, files in source_path.walk():
-            dirs[:] = [dir for dir in dirs if (root / dir / "__init__.py").exists()]
-
-            relative = root.relative_to(source_path)
-            sources[str(install_path / relative)] = {
-                str(relative / file) for file in files if is_python_source(file)
-            }
+        stack = [Path()]
+        while stack:
+            relative = stack.pop()
+            package_sources = set()
+            with os.scandir(source_path / relative) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if os.path.exists(os.path.join(entry.path, "__init__.py")):
+                            stack.append(relative / entry.name)
+                    elif is_python_source(entry.name):
+                        package_sources.add(str(relative / entry.name))
+            sources[str(install_path / relative)] = package_sources
     return sources
 
 
@@ -235,30 +265,83 @@ INSTALL_SOURCES_PATTERN = rf"""
 """
 
 
+# INSTALL_SOURCES_PATTERN has no significant whitespace, so it can be compiled
+# without the overhead of regex.VERBOSE if we strip the whitespace ourselves.
+INSTALL_SOURCES_PATTERN_COMPACT = "".join(INSTALL_SOURCES_PATTERN.split())
+
+
+@functools.lru_cache(maxsize=8)
+def compile_install_sources_pattern(py_installation: str) -> "regex.Pattern[str]":
+    return regex.compile(
+        INSTALL_SOURCES_PATTERN_COMPACT.format(regex.escape(py_installation)),
+        flags=regex.MULTILINE,
+    )
+
+
+def find_install_sources(
+    contents: str, py_installation: str
+) -> Iterator["regex.Match[str]"]:
+    # Equivalent to compile_install_sources_pattern().finditer(), but only
+    # tries the lines containing "install_sources" instead of every line.
+    pattern = compile_install_sources_pattern(py_installation)
+    pos = 0
+    while True:
+        i = contents.find("install_sources", pos)
+        if i < 0:
+            return
+        line_start = contents.rfind("\n", 0, i) + 1
+        if line_start >= pos:
+            match = pattern.match(contents, line_start)
+            if match:
+                yield match
+                pos = match.end()
+                continue
+        pos = contents.find("\n", i) + 1
+        if pos == 0:
+            return
+
+
+def format_install_sources(
+    py_installation: str, sources: Iterable[str], kwargs: Mapping[str, str]
+) -> str:
+    parts = [py_installation, ".install_sources(\n"]
+    for source in sources:
+        parts.append(f"    {source!r},\n")
+    for keyword, value in kwargs.items():
+        parts.append(f"    {keyword}: {value},\n")
+    parts.append(")")
+    return "".join(parts)
+
+
 class CannotFixError(Exception):
     pass
 
 
-def fix_package_meson_build(
-    contents: str,
-    py_installation: str,
-    package_sources: Mapping[str, Set[str]],
-) -> str:
-    matches = {}
-    found_install_sources = {}
-    for match in regex.finditer(
-        INSTALL_SOURCES_PATTERN.format(regex.escape(py_installation)),
-        contents,
-        flags=regex.MULTILINE | regex.VERBOSE,
-    ):
+class InstallSources(NamedTuple):
+    subdir: str
+    match: "regex.Match[str]"
+    sources: Tuple[str, ...]
+    kwargs: Tuple[Tuple[str, str], ...]
+
+
+# This cache only helps repeated in-process calls with the same contents (e.g.,
+# library callers or tests); the command line tool parses each file once. The
+# result is shared between callers, so it is immutable, and the cache is small
+# because each entry keeps the whole file contents alive.
+@functools.lru_cache(maxsize=16)
+def parse_install_sources(
+    contents: str, py_installation: str
+) -> Tuple[InstallSources, ...]:
+    found = {}
+    for match in find_install_sources(contents, py_installation):
         if match.group("unrecognized"):
             raise CannotFixError(
                 f"unrecognized {py_installation}.install_sources() syntax"
             )
 
-        kwargs = dict(zip(match.captures("keyword"), match.captures("value")))
+        kwargs = tuple(zip(match.captures("keyword"), match.captures("value")))
         try:
-            subdir_arg = kwargs["subdir"]
+            subdir_arg = dict(kwargs)["subdir"]
         except KeyError:
             subdir = "."
         else:
@@ -268,16 +351,33 @@ def fix_package_meson_build(
                 )
             subdir = ast.literal_eval(subdir_arg)
 
-        if subdir in matches:
+        if subdir in found:
             raise CannotFixError(
                 f"duplicate {py_installation}.install_sources(..., subdir: {subdir!r})"
             )
 
-        matches[subdir] = match
-        found_install_sources[subdir] = (
-            [ast.literal_eval(arg) for arg in match.captures("posarg")],
+        found[subdir] = InstallSources(
+            subdir,
+            match,
+            tuple(ast.literal_eval(arg) for arg in match.captures("posarg")),
             kwargs,
         )
+    return tuple(found.values())
+
+
+def fix_package_meson_build(
+    contents: str,
+    py_installation: str,
+    package_sources: Mapping[str, AbstractSet[str]],
+) -> str:
+    matches = {}
+    found_install_sources = {}
+    for install_sources in parse_install_sources(contents, py_installation):
+        matches[install_sources.subdir] = install_sources.match
+        found_install_sources[install_sources.subdir] = (
+            list(install_sources.sources),
+            dict(install_sources.kwargs),
+        )
 
     expected_install_sources = []
     for subdir, sources in package_sources.items():
@@ -327,24 +427,19 @@ def fix_package_meson_build(
             elif not contents.endswith("\n\n"):
                 parts.append("\n")
 
-    for i, (subdir, (expected_sources, kwargs)) in enumerate(expected_install_sources):
+    blocks = []
+    for subdir, (expected_sources, kwargs) in expected_install_sources:
         if found_install_sources.get(subdir) == (expected_sources, kwargs):
-            parts.append(matches[subdir].group(0))
+            blocks.append(matches[subdir].group(0))
         else:
             if subdir in matches and matches[subdir].captures("comment"):
                 raise CannotFixError(
                     f"{py_installation}.install_sources() call contains comments"
                 )
-            parts.append(py_installation)
-            parts.append(".install_sources(\n")
-            for source in expected_sources:
-                parts.append(f"    {source!r},\n")
-            for keyword, value in kwargs.items():
-                parts.append(f"    {keyword}: {value},\n")
-            parts.append(")")
-
-        if i < len(expected_install_sources) - 1:
-            parts.append("\n\n")
+            blocks.append(
+                format_install_sources(py_installation, expected_sources, kwargs)
+            )
+    parts.append("\n\n".join(blocks))
 
     if matches:
         parts.append(contents[matches_end:])
@@ -357,7 +452,7 @@ def fix_package_meson_build(
 def update_package_meson_build(
     meson_build_path: Path,
     py_installation: str,
-    package_sources: Mapping[str, Set[str]],
+    package_sources: Mapping[str, AbstractSet[str]],
     *,
     mode: Literal["update", "check", "diff"],
     color_stdout: bool = False,
@@ -1,21 +1,29 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
 # SPDX-License-Identifier: MIT
 
+import collections
 import contextlib
 import io
+import os
 from pathlib import Path
+import tempfile
+import time
+import types
 import unittest
+import unittest.mock
 
-import pyfakefs.fake_filesystem_unittest
 import regex
 
 from meson_python_sources_fixer import (
     INSTALL_SOURCES_PATTERN,
     CannotFixError,
+    compile_install_sources_pattern,
+    find_install_sources,
     find_package_sources,
     find_py_installation,
     find_subdirs,
     fix_package_meson_build,
+    parse_install_sources,
     update_package_meson_build,
 )
 
@@ -153,50 +161,66 @@ subdir('pkg2') #
         )
 
 
-class TestFindPackageSources(pyfakefs.fake_filesystem_unittest.TestCase):
+class TemporaryDirectoryMixin:
+    # Runs each test in a new, empty current working directory.
     def setUp(self):
-        self.setUpPyfakefs()
+        super().setUp()
+        self._tmp = tempfile.TemporaryDirectory()
+        self._cwd = os.getcwd()
+        os.chdir(self._tmp.name)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+        super().tearDown()
+
+
+class TestFindPackageSources(TemporaryDirectoryMixin, unittest.TestCase):
+    def create_file(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
 
     def test_one_file(self):
-        self.fs.create_file("/pkg/__init__.py")
+        self.create_file("pkg/__init__.py")
 
         self.assertEqual(
-            find_package_sources(Path("/pkg"), Path("pkg")),
+            find_package_sources(Path("pkg"), Path("pkg")),
             {"pkg": {"__init__.py"}},
         )
 
     def test_multiple_files(self):
-        self.fs.create_file("/pkg/__init__.py")
-        self.fs.create_file("/pkg/foo.py")
-        self.fs.create_file("/pkg/py.typed")
-        self.fs.create_file("/pkg/bar.pyi")
+        self.create_file("pkg/__init__.py")
+        self.create_file("pkg/foo.py")
+        self.create_file("pkg/py.typed")
+        self.create_file("pkg/bar.pyi")
 
         self.assertEqual(
-            find_package_sources(Path("/pkg"), Path("pkg")),
+            find_package_sources(Path("pkg"), Path("pkg")),
             {"pkg": {"__init__.py", "foo.py", "py.typed", "bar.pyi"}},
         )
 
     def test_not_package(self):
-        self.fs.create_file("/pkg/foo.py")
-        self.fs.create_file("/pkg/py.typed")
+        self.create_file("pkg/foo.py")
+        self.create_file("pkg/py.typed")
 
         self.assertEqual(
-            find_package_sources(Path("/pkg"), Path("pkg")),
+            find_package_sources(Path("pkg"), Path("pkg")),
             {},
         )
 
     def test_nested(self):
-        self.fs.create_file("/pkg/__init__.py")
-        self.fs.create_file("/pkg/foo.py")
+        self.create_file("pkg/__init__.py")
+        self.create_file("pkg/foo.py")
 
-        self.fs.create_file("/pkg/a/__init__.py")
-        self.fs.create_file("/pkg/a/bar.py")
+        self.create_file("pkg/a/__init__.py")
+        self.create_file("pkg/a/bar.py")
 
-        self.fs.create_file("/pkg/b/__init__.py")
-        self.fs.create_file("/pkg/b/baz.py")
+        self.create_file("pkg/b/__init__.py")
+        self.create_file("pkg/b/baz.py")
 
         self.assertEqual(
-            find_package_sources(Path("/pkg"), Path("pkg")),
+            find_package_sources(Path("pkg"), Path("pkg")),
             {
                 "pkg": {"__init__.py", "foo.py"},
                 "pkg/a": {"a/__init__.py", "a/bar.py"},
@@ -205,18 +229,18 @@ class TestFindPackageSources(pyfakefs.fake_filesystem_unittest.TestCase):
         )
 
     def test_nested_not_package(self):
-        self.fs.create_file("/pkg/__init__.py")
-        self.fs.create_file("/pkg/foo.py")
+        self.create_file("pkg/__init__.py")
+        self.create_file("pkg/foo.py")
 
-        self.fs.create_file("/pkg/a/__init__.py")
-        self.fs.create_file("/pkg/a/bar.py")
+        self.create_file("pkg/a/__init__.py")
+        self.create_file("pkg/a/bar.py")
 
-        self.fs.create_file("/pkg/b/baz.py")
+        self.create_file("pkg/b/baz.py")
 
-        self.fs.create_file("/pkg/b/c/__init__.py")
+        self.create_file("pkg/b/c/__init__.py")
 
         self.assertEqual(
-            find_package_sources(Path("/pkg"), Path("pkg")),
+            find_package_sources(Path("pkg"), Path("pkg")),
             {
                 "pkg": {"__init__.py", "foo.py"},
                 "pkg/a": {"a/__init__.py", "a/bar.py"},
@@ -225,7 +249,8 @@ class TestFindPackageSources(pyfakefs.fake_filesystem_unittest.TestCase):
 
 
 class TestInstallSourcesRegex(unittest.TestCase):
-    REGEX = regex.compile(
+    REGEX = compile_install_sources_pattern("py")
+    VERBOSE_REGEX = regex.compile(
         INSTALL_SOURCES_PATTERN.format("py"), flags=regex.MULTILINE | regex.VERBOSE
     )
 
@@ -238,10 +263,14 @@ class TestInstallSourcesRegex(unittest.TestCase):
         if match.end() < len(contents):
             self.assertEqual(contents[match.end()], "\n")
 
-        self.assertEqual(match.captures("posarg"), posargs)
-        self.assertEqual(
-            list(zip(match.captures("keyword"), match.captures("value"))), kwargs
-        )
+        captures = match.capturesdict()
+        self.assertEqual(captures["posarg"], posargs)
+        self.assertEqual(list(zip(captures["keyword"], captures["value"])), kwargs)
+
+        # The compact pattern must be equivalent to the original.
+        verbose_match = self.VERBOSE_REGEX.search(contents)
+        self.assertEqual(verbose_match.span(), match.span())
+        self.assertEqual(verbose_match.capturesdict(), captures)
 
     def test_no_arguments(self):
         self.assert_matches("py.install_sources()\n", [], [])
@@ -381,11 +410,206 @@ py.install_sources(
                     )
 
 
+class TestFindInstallSources(unittest.TestCase):
+    def assert_finds(self, contents, expected):
+        self.assertEqual(
+            [match.group(0) for match in find_install_sources(contents, "py")],
+            expected,
+        )
+        self.assertEqual(
+            [
+                match.group(0)
+                for match in compile_install_sources_pattern("py").finditer(contents)
+            ],
+            expected,
+        )
+
+    def test_empty(self):
+        self.assert_finds("", [])
+
+    def test_multiple(self):
+        self.assert_finds(
+            """\
+message('hello')
+py.install_sources('__init__.py', subdir: 'pkg')
+py.install_sources(
+    'a/__init__.py',
+    subdir: 'pkg/a',
+) # install_sources
+""",
+            [
+                "py.install_sources('__init__.py', subdir: 'pkg')",
+                """\
+py.install_sources(
+    'a/__init__.py',
+    subdir: 'pkg/a',
+) # install_sources""",
+            ],
+        )
+
+    def test_not_install_sources(self):
+        self.assert_finds(
+            """\
+# py.install_sources('__init__.py')
+py3.install_sources('__init__.py')
+message('py.install_sources()')
+""",
+            [],
+        )
+
+    def test_unrecognized(self):
+        self.assert_finds(
+            "py.install_sources(sources)\npy.install_sources()",
+            ["py.install_sources(s", "py.install_sources()"],
+        )
+
+
+class TestParseInstallSources(unittest.TestCase):
+    def test_parse(self):
+        contents = """\
+py.install_sources('__init__.py', subdir: 'pkg')
+py.install_sources('data.txt', ['a/__init__.py'], subdir: 'pkg/a', pure: true)
+"""
+        self.assertEqual(
+            [
+                (
+                    install_sources.subdir,
+                    install_sources.sources,
+                    install_sources.kwargs,
+                )
+                for install_sources in parse_install_sources(contents, "py")
+            ],
+            [
+                ("pkg", ("__init__.py",), (("subdir", "'pkg'"),)),
+                (
+                    "pkg/a",
+                    ("data.txt", "a/__init__.py"),
+                    (("subdir", "'pkg/a'"), ("pure", "true")),
+                ),
+            ],
+        )
+
+    def test_no_subdir(self):
+        self.assertEqual(
+            [
+                install_sources.subdir
+                for install_sources in parse_install_sources(
+                    "py.install_sources('foo.py')\n", "py"
+                )
+            ],
+            ["."],
+        )
+
+    def test_cached(self):
+        contents = "py.install_sources('__init__.py', subdir: 'pkg')\n"
+        self.assertIs(
+            parse_install_sources(contents, "py"),
+            parse_install_sources(contents, "py"),
+        )
+
+
+PKG_INSTALL_SOURCES = """\
+py.install_sources(
+    '__init__.py',
+    'foo.py',
+    subdir: 'pkg',
+)"""
+PKG_INIT_INSTALL_SOURCES = """\
+py.install_sources(
+    '__init__.py',
+    subdir: 'pkg',
+)"""
+PKG_A_INIT_INSTALL_SOURCES = """\
+py.install_sources(
+    'a/__init__.py',
+    subdir: 'pkg/a',
+)"""
+
+# meson.build contents for PKG_SOURCES.
+OUT_OF_DATE_MESON_BUILD = PKG_INIT_INSTALL_SOURCES + "\n"
+UP_TO_DATE_MESON_BUILD = PKG_INSTALL_SOURCES + "\n"
+
+
+# Shared, read-only package sources for the common single package case.
+PKG_SOURCES = types.MappingProxyType({"pkg": frozenset({"__init__.py", "foo.py"})})
+
+
+CannotFixCase = collections.namedtuple(
+    "CannotFixCase", "name contents package_sources message"
+)
+CANNOT_FIX_CASES = (
+    CannotFixCase(
+        "unrecognized_install_sources",
+        """\
+sources = ['a.py', 'b.py']
+py.install_sources(sources, subdir: 'pkg')
+""",
+        {"pkg": {"a.py", "b.py"}},
+        "unrecognized",
+    ),
+    CannotFixCase(
+        "unrecognized_subdir",
+        """\
+my_subdir = 'pkg'
+py.install_sources('a.py', subdir: my_subdir)
+""",
+        {"pkg": {"a.py", "b.py"}},
+        "unrecognized.*subdir",
+    ),
+    CannotFixCase(
+        "duplicate_subdir",
+        """\
+py.install_sources('a.py', subdir: 'pkg')
+py.install_sources('b.py', subdir: 'pkg')
+""",
+        {"pkg": {"a.py", "b.py"}},
+        "duplicate",
+    ),
+    CannotFixCase(
+        "between_install_sources",
+        """\
+py.install_sources(
+    '__init__.py',
+    subdir: 'pkg',
+)
+
+# Subpackage
+py.install_sources(
+    'a/__init__.py',
+    subdir: 'pkg/a',
+)
+""",
+        {
+            "pkg": {"__init__.py", "foo.py"},
+            "pkg/a": {"a/__init__.py"},
+        },
+        "non-whitespace between",
+    ),
+    CannotFixCase(
+        "comments",
+        """\
+py.install_sources( # Before
+    # Sources.
+    '__init__.py',
+    'foo.py',
+    # Subdirectory
+    subdir: 'pkg',
+) # After
+""",
+        {"pkg": {"__init__.py", "bar.py"}},
+        "comments",
+    ),
+)
+
+
 class TestFixPackageMesonBuild(unittest.TestCase):
     def assert_ok(self, contents, py_installation, expected_sources):
+        self.assert_fixed(contents, py_installation, expected_sources, contents)
+
+    def assert_fixed(self, contents, py_installation, expected_sources, expected):
         self.assertEqual(
             fix_package_meson_build(contents, py_installation, expected_sources),
-            contents,
+            expected,
         )
 
     def test_empty(self):
@@ -400,14 +624,14 @@ class TestFixPackageMesonBuild(unittest.TestCase):
         self.assert_ok(
             "py.install_sources('__init__.py', 'foo.py', subdir: 'pkg')\n",
             "py",
-            {"pkg": {"__init__.py", "foo.py"}},
+            PKG_SOURCES,
         )
 
     def test_up_to_date_with_kwargs(self):
         self.assert_ok(
             "py.install_sources('__init__.py', 'foo.py', subdir: 'pkg', pure: true)\n",
             "py",
-            {"pkg": {"__init__.py", "foo.py"}},
+            PKG_SOURCES,
         )
 
     def test_up_to_date_with_comments(self):
@@ -422,7 +646,7 @@ py.install_sources( # Before
 ) # After
 """,
             "py",
-            {"pkg": {"__init__.py", "foo.py"}},
+            PKG_SOURCES,
         )
 
     def test_multiple_up_to_date(self):
@@ -452,19 +676,13 @@ message('goodbye')
         self.assert_ok(
             "py.install_sources('__init__.py', 'file.dat', 'foo.py', subdir: 'pkg')\n",
             "py",
-            {"pkg": {"__init__.py", "foo.py"}},
+            PKG_SOURCES,
         )
 
     def test_create_in_empty(self):
         self.assertEqual(
-            fix_package_meson_build("", "py", {"pkg": {"__init__.py", "foo.py"}}),
-            """\
-py.install_sources(
-    '__init__.py',
-    'foo.py',
-    subdir: 'pkg',
-)
-""",
+            fix_package_meson_build("", "py", PKG_SOURCES),
+            UP_TO_DATE_MESON_BUILD,
         )
 
     def test_create_multiple_in_empty(self):
@@ -499,7 +717,7 @@ py.install_sources(
                     fix_package_meson_build(
                         "message('hello, world')" + newline,
                         "py",
-                        {"pkg": {"__init__.py", "foo.py"}},
+                        PKG_SOURCES,
                     ),
                     """\
 message('hello, world')
@@ -595,15 +813,9 @@ py.install_sources(
             fix_package_meson_build(
                 "py.install_sources('foo.py', '__init__.py', subdir: 'pkg')\n",
                 "py",
-                {"pkg": {"__init__.py", "foo.py"}},
+                PKG_SOURCES,
             ),
-            """\
-py.install_sources(
-    '__init__.py',
-    'foo.py',
-    subdir: 'pkg',
-)
-""",
+            UP_TO_DATE_MESON_BUILD,
         )
 
     def test_sort_extra_sources(self):
@@ -611,7 +823,7 @@ py.install_sources(
             fix_package_meson_build(
                 "py.install_sources('foo.py', '__init__.py', 'file.dat', subdir: 'pkg')\n",
                 "py",
-                {"pkg": {"__init__.py", "foo.py"}},
+                PKG_SOURCES,
             ),
             """\
 py.install_sources(
@@ -626,9 +838,8 @@ py.install_sources(
     def test_delete(self):
         for newline in ("", "\n"):
             with self.subTest(newline=bool(newline)):
-                self.assertEqual(
-                    fix_package_meson_build(
-                        f"""\
+                self.assert_fixed(
+                    """\
 py.install_sources(
     [
         'a/__init__.py',
@@ -637,10 +848,10 @@ py.install_sources(
     subdir : 'pkg/a',
     pure : true,
 )
-py.install_sources('__init__.py', 'foo.py', subdir: 'pkg'){newline}""",
-                        "py",
-                        {"pkg": {"__init__.py", "foo.py"}},
-                    ),
+py.install_sources('__init__.py', 'foo.py', subdir: 'pkg')"""
+                    + newline,
+                    "py",
+                    PKG_SOURCES,
                     "py.install_sources('__init__.py', 'foo.py', subdir: 'pkg')"
                     + newline,
                 )
@@ -687,20 +898,8 @@ py.install_sources(
             with self.subTest(
                 newline_before=newline_before, newline_after=newline_after
             ):
-                self.assertEqual(
-                    fix_package_meson_build(
-                        newline_before
-                        + """\
-py.install_sources(
-    '__init__.py',
-    'foo.py',
-    subdir: 'pkg',
-)"""
-                        + newline_after,
-                        "py",
-                        {},
-                    ),
-                    "",
+                self.assert_fixed(
+                    newline_before + PKG_INSTALL_SOURCES + newline_after, "py", {}, ""
                 )
 
     def test_delete_only_extra_newline(self):
@@ -711,62 +910,41 @@ py.install_sources(
             with self.subTest(
                 newline_before=newline_before, newline_after=newline_after
             ):
-                self.assertEqual(
-                    fix_package_meson_build(
-                        f"""\
-{newline_before}py.install_sources(
-    '__init__.py',
-    'foo.py',
-    subdir: 'pkg',
-){newline_after}""",
-                        "py",
-                        {},
-                    ),
-                    "\n",
+                self.assert_fixed(
+                    newline_before + PKG_INSTALL_SOURCES + newline_after, "py", {}, "\n"
                 )
 
     def test_delete_multiple(self):
+        subpackage_install_sources = """\
+py.install_sources(
+    'a/__init__.py',
+    'a/foo.py',
+    subdir: 'pkg/a',
+)"""
         for separating_newline in ("\n", ""):
             for trailing_newline in ("\n", ""):
                 with self.subTest(
                     separating_newline=bool(separating_newline),
                     trailing_newline=bool(trailing_newline),
                 ):
-                    self.assertEqual(
-                        fix_package_meson_build(
-                            f"""\
-py.install_sources(
-    '__init__.py',
-    'foo.py',
-    subdir: 'pkg',
-){separating_newline}
-py.install_sources(
-    'a/__init__.py',
-    'a/foo.py',
-    subdir: 'pkg/a',
-){trailing_newline}""",
-                            "py",
-                            {},
-                        ),
+                    self.assert_fixed(
+                        PKG_INSTALL_SOURCES
+                        + separating_newline
+                        + "\n"
+                        + subpackage_install_sources
+                        + trailing_newline,
+                        "py",
+                        {},
                         "",
                     )
 
     def test_delete_before_misc(self):
         for newline in ("", "\n"):
             with self.subTest(newline=bool(newline)):
-                self.assertEqual(
-                    fix_package_meson_build(
-                        f"""\
-py.install_sources(
-    '__init__.py',
-    'foo.py',
-    subdir: 'pkg',
-){newline}
-message('hello, world')
-""",
-                        "py",
-                        {},
-                    ),
+                self.assert_fixed(
+                    PKG_INSTALL_SOURCES + newline + "\nmessage('hello, world')\n",
+                    "py",
+                    {},
                     "message('hello, world')\n",
                 )
 
@@ -780,18 +958,13 @@ message('hello, world')
             with self.subTest(
                 newline_before=bool(newline_before), newline_after=bool(newline_after)
             ):
-                self.assertEqual(
-                    fix_package_meson_build(
-                        f"""\
-message('hello, world')
-{newline_before}py.install_sources(
-    '__init__.py',
-    'foo.py',
-    subdir: 'pkg',
-){newline_after}""",
-                        "py",
-                        {},
-                    ),
+                self.assert_fixed(
+                    "message('hello, world')\n"
+                    + newline_before
+                    + PKG_INSTALL_SOURCES
+                    + newline_after,
+                    "py",
+                    {},
                     "message('hello, world')\n",
                 )
 
@@ -805,24 +978,17 @@ message('hello, world')
             with self.subTest(
                 newline_before=bool(newline_before), newline_after=bool(newline_after)
             ):
-                self.assertEqual(
-                    fix_package_meson_build(
-                        f"""\
-message('hello')
-{newline_before}py.install_sources(
-    '__init__.py',
-    'foo.py',
-    subdir: 'pkg',
-){newline_after}
-message('world')
-""",
-                        "py",
-                        {},
-                    ),
-                    f"""\
-message('hello'){newline_before or newline_after}
-message('world')
-""",
+                self.assert_fixed(
+                    "message('hello')\n"
+                    + newline_before
+                    + PKG_INSTALL_SOURCES
+                    + newline_after
+                    + "\nmessage('world')\n",
+                    "py",
+                    {},
+                    "message('hello')"
+                    + (newline_before or newline_after)
+                    + "\nmessage('world')\n",
                 )
 
     def test_delete_first(self):
@@ -853,26 +1019,18 @@ py.install_sources(
     def test_delete_last(self):
         for newline in ("\n", ""):
             with self.subTest(newline=bool(newline)):
-                self.assertEqual(
-                    fix_package_meson_build(
-                        f"""\
-py.install_sources(
-    '__init__.py',
-    subdir: 'pkg',
-)
+                self.assert_fixed(
+                    PKG_INIT_INSTALL_SOURCES
+                    + """
 
 py.install_sources(
     '__init__.py',
     subdir: 'pkg/a',
-){newline}""",
-                        "py",
-                        {"pkg": {"__init__.py"}},
-                    ),
-                    f"""\
-py.install_sources(
-    '__init__.py',
-    subdir: 'pkg',
-){newline}""",
+)"""
+                    + newline,
+                    "py",
+                    {"pkg": {"__init__.py"}},
+                    PKG_INIT_INSTALL_SOURCES + newline,
                 )
 
     def test_delete_middle(self):
@@ -938,55 +1096,28 @@ py.install_sources(
     def test_insert_after(self):
         for newline in ("\n", ""):
             with self.subTest(newline=newline):
-                self.assertEqual(
-                    fix_package_meson_build(
-                        f"""\
-py.install_sources(
-    '__init__.py',
-    subdir: 'pkg',
-){newline}""",
-                        "py",
-                        {"pkg": {"__init__.py"}, "pkg/a": {"a/__init__.py"}},
-                    ),
-                    f"""\
-py.install_sources(
-    '__init__.py',
-    subdir: 'pkg',
-)
-
-py.install_sources(
-    'a/__init__.py',
-    subdir: 'pkg/a',
-){newline}""",
+                self.assert_fixed(
+                    PKG_INIT_INSTALL_SOURCES + newline,
+                    "py",
+                    {"pkg": {"__init__.py"}, "pkg/a": {"a/__init__.py"}},
+                    PKG_INIT_INSTALL_SOURCES
+                    + "\n\n"
+                    + PKG_A_INIT_INSTALL_SOURCES
+                    + newline,
                 )
 
     def test_insert_after_with_misc(self):
         for newline in ("\n", ""):
             with self.subTest(newline=bool(newline)):
-                self.assertEqual(
-                    fix_package_meson_build(
-                        f"""\
-py.install_sources(
-    '__init__.py',
-    subdir: 'pkg',
-){newline}
-message('hello, world')
-""",
-                        "py",
-                        {"pkg": {"__init__.py"}, "pkg/a": {"a/__init__.py"}},
-                    ),
-                    f"""\
-py.install_sources(
-    '__init__.py',
-    subdir: 'pkg',
-)
-
-py.install_sources(
-    'a/__init__.py',
-    subdir: 'pkg/a',
-){newline}
-message('hello, world')
-""",
+                self.assert_fixed(
+                    PKG_INIT_INSTALL_SOURCES + newline + "\nmessage('hello, world')\n",
+                    "py",
+                    {"pkg": {"__init__.py"}, "pkg/a": {"a/__init__.py"}},
+                    PKG_INIT_INSTALL_SOURCES
+                    + "\n\n"
+                    + PKG_A_INIT_INSTALL_SOURCES
+                    + newline
+                    + "\nmessage('hello, world')\n",
                 )
 
     def test_insert_middle(self):
@@ -1127,98 +1258,126 @@ py.install_sources(
 """,
         )
 
-    def test_cannot_fix_unrecognized_install_sources(self):
-        self.assertRaisesRegex(
-            CannotFixError,
-            "unrecognized",
-            fix_package_meson_build,
-            """\
-sources = ['a.py', 'b.py']
-py.install_sources(sources, subdir: 'pkg')
-""",
-            "py",
-            {"pkg": {"a.py", "b.py"}},
-        )
-
-    def test_cannot_fix_unrecognized_subdir(self):
-        self.assertRaisesRegex(
-            CannotFixError,
-            "unrecognized.*subdir",
-            fix_package_meson_build,
-            """\
-my_subdir = 'pkg'
-py.install_sources('a.py', subdir: my_subdir)
-""",
-            "py",
-            {"pkg": {"a.py", "b.py"}},
-        )
-
-    def test_cannot_fix_duplicate_subdir(self):
-        self.assertRaisesRegex(
-            CannotFixError,
-            "duplicate",
-            fix_package_meson_build,
-            """\
-py.install_sources('a.py', subdir: 'pkg')
-py.install_sources('b.py', subdir: 'pkg')
-""",
-            "py",
-            {"pkg": {"a.py", "b.py"}},
-        )
+    def test_scaling_is_linear(self):
+        def time_fix(n):
+            # Every other call is missing a source and needs to be rewritten.
+            contents = "".join(
+                f"py.install_sources('__init__.py', subdir: 'pkg/{i:05}')\n\n"
+                for i in range(n)
+            )
+            package_sources = {
+                f"pkg/{i:05}": {"__init__.py", "foo.py"} if i % 2 else {"__init__.py"}
+                for i in range(n)
+            }
+            best = float("inf")
+            for _ in range(3):
+                parse_install_sources.cache_clear()
+                start = time.perf_counter()
+                fix_package_meson_build(contents, "py", package_sources)
+                best = min(best, time.perf_counter() - start)
+            return best
+
+        # Linear growth gives a ratio of about 10, quadratic about 100.
+        self.assertLess(time_fix(2000) / time_fix(200), 40)
 
-    def test_cannot_fix_between_install_sources(self):
-        self.assertRaisesRegex(
-            CannotFixError,
-            "non-whitespace between",
-            fix_package_meson_build,
-            """\
-py.install_sources(
-    '__init__.py',
-    subdir: 'pkg',
-)
+    def test_cannot_fix(self):
+        for case in CANNOT_FIX_CASES:
+            with self.subTest(case.name):
+                self.assertRaisesRegex(
+                    CannotFixError,
+                    case.message,
+                    fix_package_meson_build,
+                    case.contents,
+                    "py",
+                    case.package_sources,
+                )
 
-# Subpackage
-py.install_sources(
-    'a/__init__.py',
-    subdir: 'pkg/a',
-)
-""",
-            "py",
-            {
-                "pkg": {"__init__.py", "foo.py"},
-                "pkg/a": {"a/__init__.py"},
-            },
-        )
-
-    def test_cannot_fix_comments(self):
-        self.assertRaisesRegex(
-            CannotFixError,
-            "comments",
-            fix_package_meson_build,
-            """\
-py.install_sources( # Before
-    # Sources.
-    '__init__.py',
-    'foo.py',
-    # Subdirectory
-    subdir: 'pkg',
-) # After
-""",
-            "py",
-            {"pkg": {"__init__.py", "bar.py"}},
-        )
 
+CANNOT_FIX_MESON_BUILD = """\
+sources = ['__init__.py', 'foo.py']
+py.install_sources(sources, subdir: 'pkg')
+"""
 
-class TestUpdatePackageMesonBuild(pyfakefs.fake_filesystem_unittest.TestCase):
-    def setUp(self):
-        self.setUpPyfakefs()
 
+# Messages printed to stderr by update_package_meson_build().
+OUT_OF_DATE_MESSAGE = "meson.build is out of date"
+DOES_NOT_EXIST_MESSAGE = "meson.build does not exist"
+UPDATED_MESSAGE = "updated meson.build"
+CREATED_MESSAGE = "created meson.build"
+CANNOT_FIX_MESSAGE = "cannot fix meson.build"
+
+UpdateCase = collections.namedtuple(
+    "UpdateCase", "name initial mode success stderr stdout final"
+)
+# An initial or final contents of None means that meson.build does not exist.
+# A stdout of None means that nothing is printed to stdout.
+UPDATE_CASES = (
+    UpdateCase(
+        "check_error",
+        OUT_OF_DATE_MESON_BUILD,
+        "check",
+        False,
+        OUT_OF_DATE_MESSAGE,
+        None,
+        OUT_OF_DATE_MESON_BUILD,
+    ),
+    UpdateCase(
+        "check_missing",
+        None,
+        "check",
+        False,
+        DOES_NOT_EXIST_MESSAGE,
+        None,
+        None,
+    ),
+    UpdateCase(
+        "fix",
+        OUT_OF_DATE_MESON_BUILD,
+        "update",
+        True,
+        UPDATED_MESSAGE,
+        None,
+        UP_TO_DATE_MESON_BUILD,
+    ),
+    UpdateCase(
+        "diff",
+        OUT_OF_DATE_MESON_BUILD,
+        "diff",
+        False,
+        OUT_OF_DATE_MESSAGE,
+        "+++",
+        OUT_OF_DATE_MESON_BUILD,
+    ),
+    UpdateCase(
+        "create",
+        None,
+        "update",
+        True,
+        CREATED_MESSAGE,
+        None,
+        UP_TO_DATE_MESON_BUILD,
+    ),
+    UpdateCase(
+        "cannot_fix",
+        CANNOT_FIX_MESON_BUILD,
+        "update",
+        False,
+        CANNOT_FIX_MESSAGE,
+        None,
+        CANNOT_FIX_MESON_BUILD,
+    ),
+)
+
+
+class TestUpdatePackageMesonBuild(TemporaryDirectoryMixin, unittest.TestCase):
     def assert_ok(self, contents, expected_sources):
-        self.fs.create_file("meson.build", contents=contents)
+        Path("meson.build").write_text(contents)
 
-        for mode in ("check", "update"):
-            with self.subTest(mode=mode):
-                with contextlib.redirect_stderr(io.StringIO()) as stderr:
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            for mode in ("check", "update"):
+                with self.subTest(mode=mode):
+                    stderr.seek(0)
+                    stderr.truncate()
                     success = update_package_meson_build(
                         Path("meson.build"),
                         "py",
@@ -1227,138 +1386,55 @@ class TestUpdatePackageMesonBuild(pyfakefs.fake_filesystem_unittest.TestCase):
                     )
                     self.assertTrue(success, "stderr:\n" + stderr.getvalue())
                     self.assertFalse(stderr.getvalue())
-                self.assertEqual(Path("meson.build").read_text(), contents)
+                    self.assertEqual(Path("meson.build").read_text(), contents)
 
     def test_empty(self):
         self.assert_ok("", {})
 
     def test_ok(self):
-        self.assert_ok(
-            """\
-py.install_sources(
-    '__init__.py',
-    'foo.py',
-    subdir: 'pkg',
-)
-""",
-            {"pkg": {"__init__.py", "foo.py"}},
-        )
-
-    def test_check_error(self):
-        contents = """\
-py.install_sources(
-    '__init__.py',
-    subdir: 'pkg',
-)
-"""
-        self.fs.create_file("meson.build", contents=contents)
-        with contextlib.redirect_stderr(io.StringIO()) as stderr:
-            success = update_package_meson_build(
-                Path("meson.build"),
-                "py",
-                {"pkg": {"__init__.py", "foo.py"}},
-                mode="check",
-            )
-            self.assertFalse(success, "stderr:\n" + stderr.getvalue())
-            self.assertIn("meson.build is out of date", stderr.getvalue())
-            self.assertEqual(Path("meson.build").read_text(), contents)
-
-    def test_check_missing(self):
-        with contextlib.redirect_stderr(io.StringIO()) as stderr:
-            success = update_package_meson_build(
-                Path("meson.build"),
-                "py",
-                {"pkg": {"__init__.py", "foo.py"}},
-                mode="check",
-            )
-            self.assertFalse(success, "stderr:\n" + stderr.getvalue())
-            self.assertIn("meson.build does not exist", stderr.getvalue())
-            self.assertFalse(Path("meson.build").exists())
-
-    def test_fix(self):
-        contents = """\
-py.install_sources(
-    '__init__.py',
-    subdir: 'pkg',
-)
-"""
-        self.fs.create_file("meson.build", contents=contents)
-        with contextlib.redirect_stderr(io.StringIO()) as stderr:
-            success = update_package_meson_build(
-                Path("meson.build"),
-                "py",
-                {"pkg": {"__init__.py", "foo.py"}},
-                mode="update",
-            )
-            self.assertTrue(success, "stderr:\n" + stderr.getvalue())
-            self.assertIn("updated meson.build", stderr.getvalue())
-            self.assertEqual(
-                Path("meson.build").read_text(),
-                """\
-py.install_sources(
-    '__init__.py',
-    'foo.py',
-    subdir: 'pkg',
-)
-""",
-            )
-
-    def test_diff(self):
-        contents = """\
-py.install_sources(
-    '__init__.py',
-    subdir: 'pkg',
-)
-"""
-        self.fs.create_file("meson.build", contents=contents)
-        with contextlib.redirect_stdout(
-            io.StringIO()
-        ) as stdout, contextlib.redirect_stderr(io.StringIO()) as stderr:
-            success = update_package_meson_build(
-                Path("meson.build"),
-                "py",
-                {"pkg": {"__init__.py", "foo.py"}},
-                mode="diff",
-            )
-            self.assertFalse(success, "stderr:\n" + stderr.getvalue())
-            self.assertIn("+++", stdout.getvalue())
-            self.assertIn("meson.build is out of date", stderr.getvalue())
-            self.assertEqual(Path("meson.build").read_text(), contents)
-
-    def test_create(self):
-        with contextlib.redirect_stderr(io.StringIO()) as stderr:
-            success = update_package_meson_build(
-                Path("meson.build"),
-                "py",
-                {"pkg": {"__init__.py", "foo.py"}},
-                mode="update",
-            )
-            self.assertTrue(success, "stderr:\n" + stderr.getvalue())
-            self.assertIn("created meson.build", stderr.getvalue())
-            self.assertEqual(
-                Path("meson.build").read_text(),
-                """\
-py.install_sources(
-    '__init__.py',
-    'foo.py',
-    subdir: 'pkg',
-)
-""",
-            )
-
-    def test_cannot_fix(self):
-        contents = """\
-sources = ['__init__.py', 'foo.py']
-py.install_sources(sources, subdir: 'pkg')
-"""
-        self.fs.create_file("meson.build", contents=contents)
-        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+        self.assert_ok(UP_TO_DATE_MESON_BUILD, PKG_SOURCES)
+
+    def test_update(self):
+        meson_build = Path("meson.build")
+        for case in UPDATE_CASES:
+            with self.subTest(case.name):
+                if case.initial is None:
+                    meson_build.unlink(missing_ok=True)
+                else:
+                    meson_build.write_text(case.initial)
+
+                with contextlib.redirect_stdout(
+                    io.StringIO()
+                ) as stdout, contextlib.redirect_stderr(io.StringIO()) as stderr:
+                    success = update_package_meson_build(
+                        meson_build,
+                        "py",
+                        PKG_SOURCES,
+                        mode=case.mode,
+                    )
+                self.assertEqual(success, case.success, "stderr:\n" + stderr.getvalue())
+                self.assertIn(case.stderr, stderr.getvalue())
+                if case.stdout is None:
+                    self.assertFalse(stdout.getvalue())
+                else:
+                    self.assertIn(case.stdout, stdout.getvalue())
+                if case.final is None:
+                    self.assertFalse(meson_build.exists())
+                else:
+                    self.assertEqual(meson_build.read_text(), case.final)
+
+    def test_noop_when_already_correct(self):
+        Path("meson.build").write_text(UP_TO_DATE_MESON_BUILD)
+        with unittest.mock.patch.object(
+            Path, "write_text", autospec=True
+        ) as write_text, contextlib.redirect_stderr(io.StringIO()) as stderr:
             success = update_package_meson_build(
                 Path("meson.build"),
                 "py",
-                {"pkg": {"__init__.py", "foo.py"}},
+                PKG_SOURCES,
                 mode="update",
             )
-            self.assertFalse(success, "stderr:\n" + stderr.getvalue())
-            self.assertIn("cannot fix meson.build", stderr.getvalue())
-            self.assertEqual(Path("meson.build").read_text(), contents)
+        self.assertTrue(success, "stderr:\n" + stderr.getvalue())
+        self.assertFalse(stderr.getvalue())
+        write_text.assert_not_called()
+        self.assertEqual(Path("meson.build").read_text(), UP_TO_DATE_MESON_BUILD)